@@ -6,7 +6,21 @@ set -eu
 VERSION="3.0.1"
 OPENROUTER_URL="https://openrouter.ai/api/v1"
 OLLAMA_URL="http://localhost:11434/api"
-REQUEST_TIMEOUT=60
+CONNECT_TIMEOUT=10
+REQUEST_TIMEOUT=300  # per attempt; no retry starts after this
+LIST_TIMEOUT=30
+STALL_TIMEOUT=60     # streamed OpenRouter replies fail after this long idle
+REQUEST_RETRIES=3
+CACHE_DIR="${XDG_CACHE_HOME:-${HOME:+$HOME/.cache}}"
+MODELS_CACHE_TTL=60  # minutes
+USE_CACHE=1
+STREAM=false
+
+# Without XDG_CACHE_HOME or HOME there is nowhere safe to cache
+if [ -n "$CACHE_DIR" ]; then CACHE_DIR="$CACHE_DIR/aifixer"; else USE_CACHE=0; fi
+
+# Probed once: progress and timing output only go to an interactive stderr
+if [ -t 2 ]; then STDERR_TTY=1; else STDERR_TTY=0; fi
 
 # Default values
 MODEL="${AIFIXER_MODEL:-anthropic/claude-sonnet-4}"
@@ -18,173 +32,238 @@ log_error() {
     printf "ERROR: %s\n" "$*" >&2
 }
 
-# Build JSON payload with proper escaping
+# Build JSON payload with proper escaping from the prompt and stdin
 build_payload() {
     model="$1"
-    content="$2"
+    prompt="$2"
     
-    # Use printf to ensure content is passed correctly to jq
-    printf '%s' "$content" | jq -Rs --arg model "$model" \
+    { printf '%s' "$prompt"; cat; } | \
+        jq -cRs --arg model "$model" --argjson stream "$STREAM" \
         '{
             model: $model,
             messages: [{role: "user", content: .}],
-            temperature: 0.7
-        }' | jq -c .
+            temperature: 0.7,
+            stream: $stream
+        }'
 }
 
 # Build Ollama payload with proper escaping
 build_ollama_payload() {
     model="$1"
-    content="$2"
+    prompt="$2"
     
-    # Use printf to ensure content is passed correctly to jq
-    printf '%s' "$content" | jq -Rs --arg model "$model" \
+    { printf '%s' "$prompt"; cat; } | \
+        jq -cRs --arg model "$model" --argjson stream "$STREAM" \
         '{
             model: $model,
             messages: [{role: "user", content: .}],
-            stream: false
-        }' | jq -c .
+            stream: $stream
+        }'
 }
 
 # Simple progress indicator
 show_progress() {
-    if [ -t 2 ]; then
+    if [ "$STDERR_TTY" = "1" ]; then
         printf "Processing with %s..." "$1" >&2
     fi
 }
 
 show_done() {
-    if [ -t 2 ]; then
+    if [ "$STDERR_TTY" = "1" ]; then
         printf " done\n" >&2
     fi
 }
 
 # ─── API Functions ────────────────────────────────────────────────────────────
 
+# Shared curl transport; -m is per attempt, retries stop after REQUEST_TIMEOUT
+http_request() {
+    curl -s -S --connect-timeout "$CONNECT_TIMEOUT" -m "$REQUEST_TIMEOUT" \
+        --retry "$REQUEST_RETRIES" --retry-max-time "$REQUEST_TIMEOUT" "$@"
+}
+
+# Send the JSON payload on stdin to the API
 call_openrouter() {
-    api_key="$1"
-    model="$2"
-    content="$3"
-    
-    payload=$(build_payload "$model" "$content")
-    
-    # Store response in temp file to avoid shell interpretation
-    response_file=$(mktemp)
-    trap "rm -f '$response_file'" EXIT
+    response_file="$1"
     
-    if curl -s -S -m "$REQUEST_TIMEOUT" \
-        -H "Authorization: Bearer $api_key" \
+    http_request \
+        -H "Authorization: Bearer $OPENROUTER_API_KEY" \
         -H "Content-Type: application/json" \
-        -d "$payload" \
-        "$OPENROUTER_URL/chat/completions" > "$response_file"; then
-        cat "$response_file"
-    else
-        rm -f "$response_file"
-        return 1
-    fi
-    
-    rm -f "$response_file"
+        --data-binary @- \
+        -o "$response_file" "$OPENROUTER_URL/chat/completions"
 }
 
 call_ollama() {
-    model="$1"
-    content="$2"
-    
-    payload=$(build_ollama_payload "$model" "$content")
+    response_file="$1"
     
-    # Store response in temp file to avoid shell interpretation
-    response_file=$(mktemp)
-    trap "rm -f '$response_file'" EXIT
+    http_request \
+        -H "Content-Type: application/json" \
+        --data-binary @- \
+        -o "$response_file" "$OLLAMA_URL/chat"
+}
+
+# Stream a completion to stdout, keeping the raw events in response_file
+stream_openrouter() {
+    response_file="$1"
+    status_file="$2"
     
-    if curl -s -S -m "$REQUEST_TIMEOUT" \
+    { http_request --retry 0 -N -m 0 -y "$STALL_TIMEOUT" -Y 1 \
+        -H "Authorization: Bearer $OPENROUTER_API_KEY" \
         -H "Content-Type: application/json" \
-        -d "$payload" \
-        "$OLLAMA_URL/chat" > "$response_file"; then
-        cat "$response_file"
-    else
-        rm -f "$response_file"
-        return 1
-    fi
+        --data-binary @- \
+        "$OPENROUTER_URL/chat/completions" || echo "$?" > "$status_file"; } |
+        tee "$response_file" | \
+        jq -n -e -R -j --unbuffered '
+            inputs | select(startswith("data: ")) | ltrimstr("data: ")
+            | fromjson? | .choices[0].delta.content // empty'
+}
+
+# Stream an Ollama reply to stdout (one JSON object per line, not SSE)
+stream_ollama() {
+    response_file="$1"
+    status_file="$2"
     
-    rm -f "$response_file"
+    # Ollama sends nothing while it loads a model or reads the prompt, so
+    # it gets the full request timeout before a stall is an error
+    { http_request --retry 0 -N -m 0 -y "$REQUEST_TIMEOUT" -Y 1 \
+        -H "Content-Type: application/json" \
+        --data-binary @- \
+        "$OLLAMA_URL/chat" || echo "$?" > "$status_file"; } |
+        tee "$response_file" | \
+        jq -n -e -R -j --unbuffered '
+            inputs | fromjson? | .message.content // empty'
 }
 
-# Extract content from response using temp file
+# Print the completion text from a response file, failing if there is none
 extract_content() {
     provider="$1"
-    response="$2"
-    
-    # Use temp file to avoid issues with special characters
-    content_file=$(mktemp)
-    trap "rm -f '$content_file'" EXIT
+    response_file="$2"
     
+    # -e makes jq exit non-zero when the filter produces no output, so the
+    # content can go straight to stdout without a staging file
     if [ "$provider" = "ollama" ]; then
-        printf '%s' "$response" | jq -r '.message.content // empty' > "$content_file"
+        jq -e -r '.message.content // empty' "$response_file"
     else
-        printf '%s' "$response" | jq -r '.choices[0].message.content // empty' > "$content_file"
-    fi
-    
-    # Check if we got content
-    if [ -s "$content_file" ]; then
-        cat "$content_file"
-        rm -f "$content_file"
-        return 0
-    else
-        rm -f "$content_file"
-        return 1
+        jq -e -r '.choices[0].message.content // empty' "$response_file"
     fi
 }
 
-# Check for API error
+# Check a response file for an API error
 check_error() {
-    response="$1"
-    printf '%s' "$response" | jq -r '.error.message // .error // empty' 2>/dev/null || true
+    response_file="$1"
+    jq -r '.error.message // .error // empty' "$response_file" 2>/dev/null || true
+}
+
+# Check a streamed response file for an API error, either a plain JSON
+# error body or an error event inside the stream
+check_stream_error() {
+    response_file="$1"
+    jq -R -r 'ltrimstr("data: ") | fromjson? | objects
+        | .error.message // .error // empty' "$response_file" 2>/dev/null || true
 }
 
 # ─── Model Listing ────────────────────────────────────────────────────────────
 
+# Print the OpenRouter model list JSON, cached and revalidated by ETag
+fetch_openrouter_models() {
+    cache_file="$CACHE_DIR/models.json"
+    etag_file="$CACHE_DIR/models.etag"
+    
+    if [ "$USE_CACHE" = "1" ] && [ -s "$cache_file" ] &&
+        [ -n "$(find "$cache_file" -mmin "-$MODELS_CACHE_TTL" 2>/dev/null)" ]; then
+        cat "$cache_file"
+        return 0
+    fi
+    
+    etag=""
+    if [ "$USE_CACHE" = "1" ] && [ -s "$cache_file" ] && [ -s "$etag_file" ]; then
+        etag=$(cat "$etag_file")
+    fi
+    
+    models_file="$WORK_DIR/models.json"
+    headers_file="$WORK_DIR/models.headers"
+    
+    if ! status=$(http_request -m "$LIST_TIMEOUT" -w '%{http_code}' \
+        -o "$models_file" -D "$headers_file" \
+        ${etag:+-H "If-None-Match: $etag"} "$OPENROUTER_URL/models"); then
+        return 1
+    fi
+    
+    if [ "$status" = "304" ]; then
+        touch "$cache_file"
+        cat "$cache_file"
+        return 0
+    fi
+    
+    # Only cache a valid model list, and swap it in atomically so a
+    # concurrent run never reads a partial file
+    if [ "$USE_CACHE" = "1" ] && jq -e '.data' "$models_file" >/dev/null 2>&1 &&
+        mkdir -p "$CACHE_DIR" 2>/dev/null &&
+        cache_tmp=$(mktemp "$CACHE_DIR/models.XXXXXX" 2>/dev/null); then
+        cp "$models_file" "$cache_tmp" && mv -f "$cache_tmp" "$cache_file" ||
+            rm -f "$cache_tmp"
+        
+        # Headers from retried attempts are appended, so keep the last ETag
+        etag=$(sed -n 's/^[Ee][Tt][Aa][Gg]:[[:space:]]*//p' "$headers_file" |
+            tr -d '\r' | tail -n 1)
+        if [ -n "$etag" ]; then
+            printf '%s\n' "$etag" > "$etag_file"
+        else
+            rm -f "$etag_file"
+        fi
+    fi
+    
+    cat "$models_file"
+}
+
 list_models() {
     provider="$1"
     
     if [ "$provider" = "openrouter" ]; then
-        curl -s -m "$REQUEST_TIMEOUT" "$OPENROUTER_URL/models" | \
-            jq -r '.data[].id' 2>/dev/null || {
-                log_error "Failed to list OpenRouter models"
-                return 1
-            }
+        # Fetch into a file first so a failed request is not masked by jq
+        list_file="$WORK_DIR/models.list"
+        if ! fetch_openrouter_models > "$list_file" ||
+            ! jq -r '.data[].id' "$list_file" 2>/dev/null; then
+            log_error "Failed to list OpenRouter models"
+            return 1
+        fi
     else
-        curl -s -m "$REQUEST_TIMEOUT" "$OLLAMA_URL/tags" | \
-            jq -r '.models[].name' 2>/dev/null || {
-                log_error "Failed to list Ollama models"
-                return 1
-            }
+        list_file="$WORK_DIR/tags.json"
+        if ! http_request -m "$LIST_TIMEOUT" -o "$list_file" "$OLLAMA_URL/tags" ||
+            ! jq -r '.models[].name' "$list_file" 2>/dev/null; then
+            log_error "Failed to list Ollama models"
+            return 1
+        fi
     fi
 }
 
 # ─── Main Processing ──────────────────────────────────────────────────────────
 
+# Send the input on stdin to the selected provider and print the reply
 process_input() {
     provider="$1"
     model="$2"
     prompt="$3"
-    input_text="$4"
-    api_key="${5:-}"
     
-    # Combine prompt and input
-    full_content="${prompt}${input_text}"
+    if [ "$STREAM" = "true" ]; then
+        process_stream "$provider" "$model" "$prompt"
+        return
+    fi
     
     show_progress "$model"
     
-    # Make API call and store response
-    response=""
+    # The payload is piped from jq into curl and the response kept on disk,
+    # so neither is ever copied through shell variables
+    response_file="$WORK_DIR/response.json"
+    
     if [ "$provider" = "ollama" ]; then
-        response=$(call_ollama "$model" "$full_content") || {
+        build_ollama_payload "$model" "$prompt" | call_ollama "$response_file" || {
             show_done
             log_error "Failed to call Ollama API"
             return 1
         }
     else
-        response=$(call_openrouter "$api_key" "$model" "$full_content") || {
+        build_payload "$model" "$prompt" | call_openrouter "$response_file" || {
             show_done
             log_error "Failed to call OpenRouter API"
             return 1
@@ -194,29 +273,85 @@ process_input() {
     show_done
     
     # Check for errors
-    if [ -z "$response" ]; then
+    if [ ! -s "$response_file" ]; then
         log_error "Empty response from API"
         return 1
     fi
     
-    error=$(check_error "$response")
+    # Decode successful responses once, straight to stdout; the error
+    # lookup only needs a second pass when no content came back
+    if extract_content "$provider" "$response_file"; then
+        return 0
+    fi
+    
+    error=$(check_error "$response_file")
     if [ -n "$error" ]; then
         log_error "API error: $error"
-        return 1
+    else
+        log_error "No content in response"
     fi
+    return 1
+}
+
+# Streaming variant of process_input: content is written as it arrives,
+# and the raw stream is only inspected for errors once it has finished
+process_stream() {
+    provider="$1"
+    model="$2"
+    prompt="$3"
     
-    # Extract and output content using temp file
-    output_file=$(mktemp)
-    trap "rm -f '$output_file'" EXIT
+    response_file="$WORK_DIR/response.txt"
+    status_file="$WORK_DIR/stream.status"
     
-    if extract_content "$provider" "$response" > "$output_file"; then
-        # Output the content exactly as received
-        cat "$output_file"
-        rm -f "$output_file"
-        return 0
+    # Each provider marks a complete stream differently
+    streamed=1
+    if [ "$provider" = "ollama" ]; then
+        api_name="Ollama"
+        done_marker='"done": *true'
+        build_ollama_payload "$model" "$prompt" |
+            stream_ollama "$response_file" "$status_file" || streamed=0
     else
-        rm -f "$output_file"
-        log_error "No content in response"
+        api_name="OpenRouter"
+        done_marker='^data: \[DONE\]'
+        build_payload "$model" "$prompt" |
+            stream_openrouter "$response_file" "$status_file" || streamed=0
+    fi
+    
+    # End with a newline like the buffered path's jq -r output
+    if [ "$streamed" -eq 1 ]; then
+        printf '\n'
+    fi
+    
+    error=$(check_stream_error "$response_file")
+    
+    # A multi-line JSON error body only parses as a whole file
+    if [ -z "$error" ] && [ "$streamed" -eq 0 ]; then
+        error=$(check_error "$response_file")
+    fi
+    
+    if [ -n "$error" ]; then
+        log_error "API error: $error"
+        return 1
+    fi
+    
+    # curl exits 28 when the stream stalls
+    if [ "$(cat "$status_file" 2>/dev/null)" = "28" ]; then
+        log_error "Timed out waiting for $api_name API"
+        return 1
+    fi
+    
+    if [ "$streamed" -eq 0 ]; then
+        if [ -s "$response_file" ]; then
+            log_error "No content in response"
+        else
+            log_error "Failed to call $api_name API"
+        fi
+        return 1
+    fi
+    
+    # Without the end-of-stream marker the reply was cut off
+    if ! grep -q "$done_marker" "$response_file"; then
+        log_error "Response stream ended early"
         return 1
     fi
 }
@@ -235,8 +370,10 @@ Options:
   -m, --model MODEL       Model to use (default: $MODEL)
   -o, --ollama MODEL      Use Ollama model
   -p, --prompt TEXT       Custom prompt
+  -s, --stream            Print the response as it is generated
   -l, --list              List OpenRouter models
   --list-ollama           List Ollama models
+  --no-cache              Fetch the OpenRouter model list even if cached
 
 Environment:
   OPENROUTER_API_KEY      Required for OpenRouter models
@@ -261,6 +398,7 @@ main() {
     ollama_model=""
     custom_prompt=""
     text_args=""
+    list_provider=""
     
     while [ $# -gt 0 ]; do
         case $1 in
@@ -296,13 +434,21 @@ main() {
                 custom_prompt="$2"
                 shift 2
                 ;;
+            -s|--stream)
+                STREAM=true
+                shift
+                ;;
             -l|--list)
-                list_models "openrouter"
-                exit $?
+                list_provider="openrouter"
+                shift
                 ;;
             --list-ollama)
-                list_models "ollama"
-                exit $?
+                list_provider="ollama"
+                shift
+                ;;
+            --no-cache)
+                USE_CACHE=0
+                shift
                 ;;
             --)
                 shift
@@ -324,57 +470,63 @@ main() {
         esac
     done
     
+    # Every temp file lives in one private directory that is removed when
+    # the script exits, however it exits
+    WORK_DIR=$(mktemp -d)
+    trap 'rm -rf "$WORK_DIR"' EXIT
+    trap 'exit 130' HUP INT TERM
+    
+    # Listing runs after parsing so flags like --no-cache apply in any order
+    if [ -n "$list_provider" ]; then
+        list_models "$list_provider"
+        exit $?
+    fi
+    
     # Set prompt
     if [ -n "$custom_prompt" ]; then
         PROMPT="$custom_prompt"
     fi
     
-    # Get input - use temp file for robustness
-    input_file=$(mktemp)
-    trap "rm -f '$input_file'" EXIT
-    
-    if [ -n "$text_args" ]; then
-        printf '%s' "$text_args" > "$input_file"
-    elif [ ! -t 0 ]; then
-        cat > "$input_file"
-    else
-        if [ -z "$custom_prompt" ]; then
-            rm -f "$input_file"
-            show_help
-            exit 0
-        fi
-        : > "$input_file"  # Create empty file
+    # Nothing to read and no prompt: show usage instead of calling the API
+    if [ -z "$text_args" ] && [ -t 0 ] && [ -z "$custom_prompt" ]; then
+        show_help
+        exit 0
     fi
     
-    # Read input from file
-    input_text=$(cat "$input_file")
-    rm -f "$input_file"
-    
     # Determine provider and model
     if [ -n "$ollama_model" ]; then
         provider="ollama"
         model="$ollama_model"
-        api_key=""
     else
         provider="openrouter"
         model="$MODEL"
-        api_key="${OPENROUTER_API_KEY:-}"
         
-        if [ -z "$api_key" ]; then
+        # Validated once here; call_openrouter reads the key directly
+        if [ -z "${OPENROUTER_API_KEY:-}" ]; then
             log_error "OPENROUTER_API_KEY not set"
             exit 1
         fi
     fi
     
-    # Process the input
-    start_time=$(date +%s 2>/dev/null || echo 0)
+    # Process the input; timing is only reported on a terminal, so skip
+    # the date fork when stderr is redirected
+    start_time=0
+    if [ "$STDERR_TTY" = "1" ]; then
+        start_time=$(date +%s 2>/dev/null || echo 0)
+    fi
     
-    if ! process_input "$provider" "$model" "$PROMPT" "$input_text" "$api_key"; then
-        exit 1
+    # Input reaches the payload builder on stdin, so piped data streams
+    # straight into the request instead of being staged in a temp file
+    if [ -n "$text_args" ]; then
+        printf '%s' "$text_args" | process_input "$provider" "$model" "$PROMPT" || exit 1
+    elif [ -t 0 ]; then
+        process_input "$provider" "$model" "$PROMPT" < /dev/null || exit 1
+    else
+        process_input "$provider" "$model" "$PROMPT" || exit 1
     fi
     
     # Show completion time if interactive
-    if [ -t 2 ] && [ "$start_time" != "0" ]; then
+    if [ "$STDERR_TTY" = "1" ] && [ "$start_time" != "0" ]; then
         end_time=$(date +%s 2>/dev/null || echo 0)
         if [ "$end_time" != "0" ]; then
             elapsed=$((end_time - start_time))
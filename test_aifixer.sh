@@ -217,6 +217,19 @@ else
   print_result "FAIL" "Piping to file execution failed"
 fi
 
+# ─── Test 6: Streaming ──────────────────────────────────────
+print_header "Test 6: Streaming"
+
+if stream_out=$(sh "$AIFIXER_CMD" --stream < "$f7" 2>/dev/null); then
+  if echo "$stream_out" | grep -q "add"; then
+    print_result "PASS" "--stream output includes response"
+  else
+    print_result "FAIL" "--stream output" "Missing function in streamed output"
+  fi
+else
+  print_result "FAIL" "--stream execution failed"
+fi
+
 # ─── Summary ──────────────────────────────────────────────────────────────────
 print_header "Test Summary"
 echo "Total tests run: $TEST_COUNT"